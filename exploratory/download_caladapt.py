@@ -1,8 +1,83 @@
 import argparse
 import os
-from process_caladapt import process_climate_data
+import dask
+from dask import delayed
+from dask.distributed import Client
+import pandas as pd
+from process_caladapt import (
+    DEFAULT_MAX_BYTES,
+    check_working_set,
+    estimate_working_set_bytes,
+    fetch_raw,
+    output_is_current,
+    output_key,
+    process_climate_data,
+    sample_test_points,
+    test_point_column,
+    write_test_points
+)
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description='Download and process all Cal-Adapt combinations.')
+    parser.add_argument('--workers', type=int, default=6,
+                        help='Number of download and processing tasks to run concurrently')
+    parser.add_argument('--format', type=str, choices=['NetCDF', 'Zarr'], default='NetCDF',
+                        help='Output format to write')
+    parser.add_argument('--force', action='store_true',
+                        help='Regenerate outputs even if up to date copies already exist')
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES,
+                        help='Refuse to download if any estimated working set exceeds this many bytes')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the estimated working set of each download and exit')
+    return parser.parse_args()
+
+OUTPUT_EXTENSIONS = {'NetCDF': '.nc', 'Zarr': '.zarr'}
+
+# Single long-format file holding the test points of every combination
+TEST_POINTS_PATH = "test_points_all.csv"
+
+def output_path_for(output_base, output_format):
+    """Build the output path for a combination in the requested format."""
+    return f"{output_base}{OUTPUT_EXTENSIONS[output_format]}"
+
+def process_combination(county, variable, aggregation, output_base, simulation, warming_level,
+                        output_format, force=False, raw_data=None):
+    """
+    Process a single (county, variable, aggregation) combination, optionally from already fetched raw data.
+    
+    Returns:
+        DataFrame of test points labelled with the combination, or None if none were sampled
+    """
+    output_path = output_path_for(output_base, output_format)
+    print(f"Processing {variable} ({aggregation}) for {county}...")
+    
+    annual_data = process_climate_data(
+        county=county,
+        variable_name=variable,
+        simulation_name=simulation,
+        warming_level=warming_level,
+        aggregation_method=aggregation,
+        output_path=output_path,
+        generate_test_points=False,
+        raw_data=raw_data,
+        output_format=output_format,
+        force=force,
+    )
+    
+    print(f"Data saved to {output_path}")
+    
+    test_df = sample_test_points(annual_data, variable, output_path)
+    if test_df is None:
+        return None
+    
+    # Label the points with their combination so all combinations share one tidy file
+    test_df = test_df.rename(columns={test_point_column(variable): 'value'})
+    return test_df.assign(county=county, variable=variable, aggregation=aggregation)
 
 def main():
+    args = parse_arguments()
+    
     # Define common parameters
     SIMULATION = "LOCA2_ACCESS-CM2_r2i1p1f1_historical+ssp245"
     WARMING_LEVEL = 2.0
@@ -30,22 +105,65 @@ def main():
         ("Tulare County", "Maximum air temperature at 2m", "mean", "meantemp_tulare_annual"),
     ]
     
-    # Process all combinations
-    for county, variable, aggregation, output_base in combinations:
-        output_path = f"{output_base}.nc"
-        print(f"Processing {variable} for {county}...")
-        
-        process_climate_data(
-            county=county,
-            variable_name=variable,
-            simulation_name=SIMULATION,
-            warming_level=WARMING_LEVEL,
-            aggregation_method=aggregation,
-            output_path=output_path,
-            generate_test_points=True,
+    # Express the combinations as a dispatch table so they can be grouped directly
+    combos = pd.DataFrame(combinations, columns=['county', 'variable', 'aggregation', 'output_base'])
+    combos['current'] = [
+        not args.force and output_is_current(
+            output_path_for(row.output_base, args.format),
+            output_key(row.county, row.variable, SIMULATION, WARMING_LEVEL, row.aggregation, args.format),
         )
+        for row in combos.itertuples()
+    ]
+    
+    # Estimate each county's working set before fetching anything, failing fast if any is too large
+    stale_counties = combos.loc[~combos['current'], 'county'].unique()
+    if len(stale_counties) == 0:
+        print("All outputs are up to date, nothing to download. Pass --force to regenerate them.")
+    if args.dry_run:
+        for county in stale_counties:
+            estimate = estimate_working_set_bytes(county)
+            status = "over limit" if estimate > args.max_bytes else "ok"
+            print(f"{county}: estimated working set {estimate / 1e9:.3f} GB per dataset ({status})")
+        return
+    
+    for county in stale_counties:
+        try:
+            check_working_set(county, args.max_bytes)
+        except ValueError as error:
+            raise SystemExit(f"error: {error}")
+    
+    # Build one task graph for all outputs: a single fetch node per (county, variable)
+    # feeding every aggregation that uses it. Groups whose outputs are all up to date
+    # get no fetch node, so nothing is downloaded for them.
+    tasks = []
+    for (county, variable), group in combos.groupby(['county', 'variable'], sort=False):
+        raw_data = None if group['current'].all() else delayed(fetch_raw)(county, variable)
         
-        print(f"Data saved to {output_path}")
+        for row in group.itertuples():
+            tasks.append(delayed(process_combination)(
+                county=county,
+                variable=variable,
+                aggregation=row.aggregation,
+                output_base=row.output_base,
+                simulation=SIMULATION,
+                warming_level=WARMING_LEVEL,
+                output_format=args.format,
+                force=args.force,
+                raw_data=raw_data,
+            ))
+    
+    with Client(n_workers=os.cpu_count(), threads_per_worker=1):
+        # Run the download-reduce-write pipelines concurrently on local threads; the chunked
+        # reductions inside each pipeline are still scheduled on the distributed cluster.
+        # NetCDF writes are deliberately serialized by process_caladapt.NETCDF_LOCK, since
+        # libnetcdf/HDF5 is not thread-safe.
+        test_dfs = dask.compute(*tasks, scheduler='threads', num_workers=args.workers)
+    
+    # Write the test points of every combination at once
+    test_dfs = [test_df for test_df in test_dfs if test_df is not None]
+    if test_dfs:
+        write_test_points(pd.concat(test_dfs, ignore_index=True), TEST_POINTS_PATH)
+        print(f"Test points saved to {TEST_POINTS_PATH}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,33 +1,112 @@
 import argparse
-import climakitae as ck 
+import datetime
+import functools
+import hashlib
+import importlib.metadata
+import numcodecs
 import numpy as np
 import pandas as pd
+import xarray as xr
 import os
+import pathlib
+import shutil
+import threading
+import zlib
+from dask.distributed import Client
 from climakitae.core.data_interface import (
     get_data_options, 
     get_subsetting_options, 
     get_data
 )
 
-def process_climate_data(county, variable_name, simulation_name, warming_level, aggregation_method, 
-                         output_path, generate_test_points=False, bbox=None):
+# Dask chunk layout for the annual reduction: apply_ufunc(dask='parallelized') needs the
+# time_delta core dimension in a single chunk, so parallelize over spatial tiles instead
+REDUCTION_CHUNKS = {'time_delta': -1, 'lat': 64, 'lon': 64}
+
+# Zarr chunk layout: whole time series per chunk, moderate spatial tiles for map reads
+ZARR_CHUNKS = {'calendar_year': -1, 'lat': 64, 'lon': 64}
+
+# NetCDF chunk layout: one annual map tile per chunk
+NETCDF_CHUNKS = {'calendar_year': 1, 'lat': 64, 'lon': 64}
+
+# Byte-shuffled zstd compresses smoothly varying float fields well at a low CPU cost
+ZARR_COMPRESSOR = numcodecs.Blosc(cname='zstd', clevel=3, shuffle=numcodecs.Blosc.SHUFFLE)
+
+# libnetcdf/HDF5 is not thread-safe and xarray does not lock every call into it, so NetCDF
+# writes and opens are serialized while downloads and reductions stay concurrent
+NETCDF_LOCK = threading.Lock()
+
+# Grid spacing of the 3 km LOCA2 data and number of months in a 30 year warming level window
+GRID_SPACING_DEG = 1 / 32
+WARMING_LEVEL_MONTHS = 360
+
+# Cal-Adapt returns the LOCA2 data as double precision
+RAW_DTYPE = np.float64
+
+# Default limit on the estimated working set of a single download
+DEFAULT_MAX_BYTES = 2 * 10**9
+
+@functools.lru_cache(maxsize=32)
+def estimate_working_set_bytes(county):
     """
-    Process climate data for a specific variable, county, simulation, and warming level.
+    Estimate the in-memory size of one simulation and warming level for a county.
+    
+    Uses the county's bounding box from the Cal-Adapt subsetting options, so nothing is
+    downloaded.
     
     Args:
-        county (str): County name to fetch data for
-        variable_name (str): Climate variable to process (e.g., "Precipitation (total)", "Temperature (min)")
-        simulation_name (str): Name of the simulation to select
-        warming_level (float): Warming level to select
-        aggregation_method (str): Method to aggregate data by year ('sum', 'min', 'max', 'mean')
-        output_path (str): Path where to save the output NetCDF file
-        generate_test_points (bool): Whether to generate test points in CSV format
-        bbox (tuple): Optional bounding box (min_lon, max_lon, min_lat, max_lat) to restrict test points
+        county (str): County name to estimate for
     
     Returns:
-        The processed xarray dataset
+        Estimated size in bytes of the monthly data for the county as returned by Cal-Adapt
+    """
+    options = get_subsetting_options(area_subset="CA counties")
+    if county not in options.index:
+        raise ValueError(f"Unknown county: {county}")
+    
+    # The options only carry the county geometry, so take the extent from its bounds
+    min_lon, min_lat, max_lon, max_lat = options.loc[county, 'geometry'].bounds
+    lat_count = int(np.ceil((max_lat - min_lat) / GRID_SPACING_DEG)) + 1
+    lon_count = int(np.ceil((max_lon - min_lon) / GRID_SPACING_DEG)) + 1
+    
+    return lat_count * lon_count * WARMING_LEVEL_MONTHS * np.dtype(RAW_DTYPE).itemsize
+
+
+def check_working_set(county, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Fail fast if a county's estimated working set exceeds the allowed size.
+    
+    Args:
+        county (str): County name to check
+        max_bytes (int): Largest estimated working set allowed
+    
+    Returns:
+        The estimated size in bytes
     """
+    estimate = estimate_working_set_bytes(county)
+    if estimate > max_bytes:
+        raise ValueError(
+            f"Estimated working set for {county} is {estimate / 1e9:.2f} GB, above the "
+            f"{max_bytes / 1e9:.2f} GB limit. Pass a larger --max-bytes to process it anyway."
+        )
+    return estimate
+
 
+@functools.lru_cache(maxsize=32)
+def fetch_raw(county, variable_name):
+    """
+    Fetch the raw monthly warming level data for a county and variable from Cal-Adapt.
+    
+    Results are cached so that aggregations sharing the same (county, variable) only
+    download the data once.
+    
+    Args:
+        county (str): County name to fetch data for
+        variable_name (str): Climate variable to fetch (e.g., "Precipitation (total)")
+    
+    Returns:
+        The raw xarray DataArray covering all simulations and warming levels
+    """
     print(f"Downloading {variable_name} data for {county}...")
     
     # Determine appropriate downscaling method and resolution based on variable
@@ -36,7 +115,7 @@ def process_climate_data(county, variable_name, simulation_name, warming_level,
     timescale = "monthly"
     
     # Get the raw data
-    climate_data = get_data(
+    return get_data(
         variable = variable_name, 
         downscaling_method = downscaling_method, 
         resolution = resolution, 
@@ -44,12 +123,168 @@ def process_climate_data(county, variable_name, simulation_name, warming_level,
         cached_area = county, 
         approach = "Warming Level"
     )
+
+
+def reduce_runs(values, starts, aggregation_method):
+    """
+    Reduce contiguous runs along the last axis of a numpy array, skipping NaNs.
+    
+    Matches xarray's skipna semantics: an all-NaN sum is 0, while an all-NaN
+    min, max, or mean is NaN.
+    
+    Args:
+        values (np.ndarray): Array whose last axis is split into runs
+        starts (np.ndarray): Sorted index of the first element of each run
+        aggregation_method (str): Reduction to apply to each run ('sum', 'min', 'max', 'mean')
+    
+    Returns:
+        Array with the last axis replaced by one value per run
+    """
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid, starts, axis=-1, dtype=np.int64)
+    
+    if aggregation_method in ('sum', 'mean'):
+        totals = np.add.reduceat(np.where(valid, values, 0), starts, axis=-1, dtype=np.float64)
+        if aggregation_method == 'sum':
+            return totals
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return totals / counts
+    elif aggregation_method == 'min':
+        reduced = np.minimum.reduceat(np.where(valid, values, np.inf), starts, axis=-1)
+    elif aggregation_method == 'max':
+        reduced = np.maximum.reduceat(np.where(valid, values, -np.inf), starts, axis=-1)
+    else:
+        raise ValueError(f"Unsupported aggregation method: {aggregation_method}")
+    
+    return np.where(counts > 0, reduced, np.nan)
+
+
+def aggregate_by_year(climate_data_wl, aggregation_method):
+    """
+    Aggregate monthly data to calendar years.
+    
+    Because time_delta is sorted, each calendar year is a contiguous run of months, so the
+    grouping reduces to a flat ufunc.reduceat over dense group boundaries instead of
+    xarray's per-group groupby dispatch.
+    
+    Args:
+        climate_data_wl: Monthly xarray DataArray with a calendar_year coordinate along time_delta
+        aggregation_method (str): Method to aggregate data by year ('sum', 'min', 'max', 'mean')
+    
+    Returns:
+        xarray DataArray with a calendar_year dimension in place of time_delta
+    """
+    if aggregation_method not in ('sum', 'min', 'max', 'mean'):
+        raise ValueError(f"Unsupported aggregation method: {aggregation_method}")
+    
+    calendar_years = climate_data_wl.calendar_year.values
+    if np.any(np.diff(calendar_years) < 0):
+        raise ValueError("calendar_year must be non-decreasing along time_delta")
     
-    # Select the specific simulation
-    climate_data_sim = climate_data.sel(simulation=simulation_name)
+    years, starts = np.unique(calendar_years, return_index=True)
     
-    # Select specific warming level
-    climate_data_wl = climate_data_sim.sel(warming_level=warming_level)
+    annual_data = xr.apply_ufunc(
+        reduce_runs,
+        climate_data_wl.drop_vars('calendar_year'),
+        kwargs={'starts': starts, 'aggregation_method': aggregation_method},
+        input_core_dims=[['time_delta']],
+        output_core_dims=[['calendar_year']],
+        dask='parallelized',
+        keep_attrs=True,
+        output_dtypes=[np.float64 if aggregation_method in ('sum', 'mean') else climate_data_wl.dtype],
+        dask_gufunc_kwargs={'output_sizes': {'calendar_year': len(years)}},
+    )
+    
+    return annual_data.assign_coords(calendar_year=years).transpose('calendar_year', ...)
+
+
+def output_key(county, variable_name, simulation_name, warming_level, aggregation_method, output_format):
+    """Hash the parameters that determine an output so unchanged outputs can be detected."""
+    params = f"{county}|{variable_name}|{simulation_name}|{warming_level}|{aggregation_method}|{output_format}"
+    return hashlib.sha1(params.encode()).hexdigest()
+
+
+def export_metadata():
+    """Provenance attributes matching those ck.export adds to the files it writes."""
+    return {
+        "Data_exported_from": "Cal-Adapt Analytics Engine",
+        "Data_export_timestamp": datetime.datetime.now().strftime("%d-%b-%Y (%H:%M)"),
+        "Analysis_package_name": "climakitae",
+        "Version": importlib.metadata.version("climakitae"),
+        "Author": "Cal-Adapt Analytics Engine Team",
+        "Author_email": "analytics@cal-adapt.org",
+        "Home_page": "https://github.com/cal-adapt/climakitae",
+        "License": "BSD 3-Clause License",
+    }
+
+
+def stamp_path_for(output_path):
+    """Path of the sidecar stamp file recording the parameters an output was built with."""
+    out = pathlib.Path(output_path)
+    return out.with_name(out.name + '.stamp')
+
+
+def output_is_current(output_path, key):
+    """Check whether an output exists and its sidecar stamp file matches the given key."""
+    out = pathlib.Path(output_path)
+    stamp_path = stamp_path_for(out)
+    if not (out.exists() and stamp_path.exists()):
+        return False
+    
+    return stamp_path.read_text().strip() == key
+
+
+def open_output(output_path, output_format="NetCDF"):
+    """Open a previously exported output lazily as an xarray DataArray."""
+    if output_format == "Zarr":
+        return xr.open_dataarray(output_path, engine='zarr', chunks={})
+    with NETCDF_LOCK:
+        return xr.open_dataarray(output_path, chunks={})
+
+
+def process_climate_data(county, variable_name, simulation_name, warming_level, aggregation_method, 
+                         output_path, generate_test_points=False, bbox=None, raw_data=None,
+                         output_format="NetCDF", force=False):
+    """
+    Process climate data for a specific variable, county, simulation, and warming level.
+    
+    Args:
+        county (str): County name to fetch data for
+        variable_name (str): Climate variable to process (e.g., "Precipitation (total)", "Temperature (min)")
+        simulation_name (str): Name of the simulation to select
+        warming_level (float): Warming level to select
+        aggregation_method (str): Method to aggregate data by year ('sum', 'min', 'max', 'mean')
+        output_path (str): Path where to save the output NetCDF file or Zarr store
+        generate_test_points (bool): Whether to generate test points in CSV format
+        bbox (tuple): Optional bounding box (min_lon, max_lon, min_lat, max_lat) to restrict test points
+        raw_data: Optional DataArray previously returned by fetch_raw for this county and variable
+        output_format (str): Output format to write ('NetCDF' or 'Zarr')
+        force (bool): Regenerate the output even if an up to date copy already exists
+    
+    Returns:
+        The processed xarray dataset
+    """
+
+    # Skip the download and processing if this output was already produced with the same parameters
+    key = output_key(county, variable_name, simulation_name, warming_level, aggregation_method, output_format)
+    if not force and output_is_current(output_path, key):
+        print(f"Output path {output_path} is up to date. Skipping.")
+        annual_data = open_output(output_path, output_format)
+        if generate_test_points:
+            generate_test_points_csv(annual_data, variable_name, output_path, bbox)
+        return annual_data
+
+    # Get the raw data, reusing an already fetched DataArray if one was provided
+    if raw_data is None:
+        climate_data = fetch_raw(county, variable_name)
+    else:
+        climate_data = raw_data
+    
+    # Select the specific simulation and warming level in a single indexing call
+    climate_data_wl = climate_data.sel(simulation=simulation_name, warming_level=warming_level)
+    
+    # Chunk lazily so the reduction streams through memory and runs in parallel
+    climate_data_wl = climate_data_wl.chunk(REDUCTION_CHUNKS)
     
     # Get the centered year value
     centered_year = climate_data_wl.centered_year.item()
@@ -57,27 +292,20 @@ def process_climate_data(county, variable_name, simulation_name, warming_level,
     
     # Calculate calendar years from time_delta values
     # time_delta is in months, from -180 to 179 (30 years × 12 months)
-    # First convert time_delta to year offset
-    year_offset = climate_data_wl.time_delta / 12
-    # Round down to get the year number relative to centered year
-    year_offset = year_offset.astype(int)
-    # Calculate actual calendar years
-    calendar_years = centered_year + year_offset
+    # Floor division yields the year number relative to the centered year, so that
+    # e.g. time_delta = -7 falls in year -1 rather than being truncated toward 0
+    time_delta = climate_data_wl.time_delta.values.astype(np.int32, copy=False)
+    calendar_years = int(centered_year) + time_delta // 12
     
     # Assign calendar years as a new coordinate
-    climate_data_wl = climate_data_wl.assign_coords(calendar_year=("time_delta", calendar_years.values))
+    climate_data_wl = climate_data_wl.assign_coords(calendar_year=("time_delta", calendar_years))
     
-    # Group by calendar year and apply the appropriate aggregation method
-    if aggregation_method == 'sum':
-        annual_data = climate_data_wl.groupby("calendar_year").sum(dim="time_delta").astype(float)
-    elif aggregation_method == 'min':
-        annual_data = climate_data_wl.groupby("calendar_year").min(dim="time_delta").astype(float)
-    elif aggregation_method == 'max':
-        annual_data = climate_data_wl.groupby("calendar_year").max(dim="time_delta").astype(float)
-    elif aggregation_method == 'mean':
-        annual_data = climate_data_wl.groupby("calendar_year").mean(dim="time_delta").astype(float)
-    else:
-        raise ValueError(f"Unsupported aggregation method: {aggregation_method}")
+    # Aggregate by calendar year with the appropriate aggregation method. Sums and means
+    # accumulate in double precision, but single precision is plenty for the stored results.
+    annual_data = aggregate_by_year(climate_data_wl, aggregation_method).astype(np.float32)
+    
+    # Compute the (small) annual result once so exporting and test point selection reuse it
+    annual_data = annual_data.persist()
     
     # Add metadata
     annual_data.attrs['centered_year'] = centered_year
@@ -86,34 +314,86 @@ def process_climate_data(county, variable_name, simulation_name, warming_level,
     annual_data.attrs['variable'] = variable_name
     annual_data.attrs['aggregation'] = aggregation_method
     
-    # Check if output path already exists, if so, remove it
-    if os.path.exists(output_path):
+    # Check if output path already exists, if so, remove it along with its stamp
+    out = pathlib.Path(output_path)
+    stamp_path = stamp_path_for(out)
+    stamp_path.unlink(missing_ok=True)
+    if out.exists():
         print(f"Output path {output_path} already exists. Removing it.")
-        os.remove(output_path)
+        if out.is_dir():
+            shutil.rmtree(out)
+        else:
+            out.unlink()
     
-    # Export the result
-    ck.export(annual_data, filename=output_path, format="NetCDF")
+    # Carry over the provenance attributes and encoding cleanup ck.export used to apply
+    dataset = annual_data.to_dataset()
+    dataset.attrs.update(export_metadata())
+    for variable in dataset.variables.values():
+        variable.encoding.pop('missing_value', None)
+    
+    # Export the result with compression
+    if output_format == "Zarr":
+        # Only Dataset.to_zarr accepts zarr_format in the pinned xarray
+        dataset.chunk(ZARR_CHUNKS).to_zarr(
+            output_path,
+            mode='w',
+            consolidated=True,
+            zarr_format=2,
+            encoding={annual_data.name: {'compressors': (ZARR_COMPRESSOR,)}}
+        )
+    elif output_format == "NetCDF":
+        chunksizes = tuple(
+            min(NETCDF_CHUNKS.get(dim, size), size)
+            for dim, size in zip(annual_data.dims, annual_data.shape)
+        )
+        # Coordinates are written without a _FillValue, as ck.export did
+        encoding = {coord: {'_FillValue': None} for coord in dataset.coords}
+        encoding[annual_data.name] = {'zlib': True, 'complevel': 3, 'shuffle': True, 'chunksizes': chunksizes}
+        with NETCDF_LOCK:
+            dataset.to_netcdf(output_path, engine='netcdf4', encoding=encoding)
+    else:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    
+    # Record the parameters used so unchanged outputs can be skipped next time
+    stamp_path.write_text(key)
     
     # Generate test points if requested
     if generate_test_points:
-        generate_test_points_csv(annual_data, variable_name, output_path, bbox)
+        if output_format == "Zarr":
+            # Read back lazily so the point selection only pulls the chunks it needs
+            test_data = open_output(output_path, output_format)
+        else:
+            test_data = annual_data
+        generate_test_points_csv(test_data, variable_name, output_path, bbox)
     
     return annual_data
 
 
-def generate_test_points_csv(annual_data, variable_name, output_path, bbox=None):
+def test_point_column(variable_name):
+    """Name of the test point value column for a climate variable."""
+    return variable_name.replace(' ', '_').lower()
+
+
+def sample_test_points(annual_data, variable_name, output_path, bbox=None):
     """
-    Generate approximately 10 test points from the climate dataset
-    and save them as a CSV file for testing purposes.
+    Sample approximately 10 test points from the climate dataset for testing purposes.
     
     Args:
         annual_data: xarray DataArray with climate data
         variable_name: Name of the climate variable
-        output_path: Base path for saving the CSV file
+        output_path: Path of the output the test points belong to, used to seed the sampling
         bbox (tuple): Optional bounding box (min_lon, max_lon, min_lat, max_lat) to restrict test points
+    
+    Returns:
+        DataFrame of test points, or None if no points fall within the bounding box
     """
     print("Generating test points for validation...")
     
+    # Use a local generator seeded from the variable and output path so concurrent calls
+    # neither share the global random state nor depend on the order in which they run.
+    # crc32 is used rather than hash(), which is salted per interpreter run.
+    rng = np.random.default_rng(seed=zlib.crc32(f"{variable_name}|{output_path}".encode()))
+    
     # Get available calendar years, latitudes, and longitudes
     calendar_years = annual_data.calendar_year.values
     lats = annual_data.lat.values
@@ -129,11 +409,11 @@ def generate_test_points_csv(annual_data, variable_name, output_path, bbox=None)
         # Exit if no points in bounding box
         if len(lons) == 0 or len(lats) == 0:
             print("Warning: No points found within the specified bounding box. Cannot generate test points.")
-            return
+            return None
     
     # Randomly select ~3 years
     if len(calendar_years) > 3:
-        selected_years = np.random.choice(calendar_years, size=3, replace=False)
+        selected_years = rng.choice(calendar_years, size=3, replace=False)
     else:
         selected_years = calendar_years
     
@@ -141,67 +421,157 @@ def generate_test_points_csv(annual_data, variable_name, output_path, bbox=None)
     num_lat_points = min(2, len(lats))
     num_lon_points = min(2, len(lons))
     
-    selected_lats = np.random.choice(lats, size=num_lat_points, replace=False)
-    selected_lons = np.random.choice(lons, size=num_lon_points, replace=False)
-    
-    # Create test points
-    test_points = []
-    for year in selected_years:
-        for lat in selected_lats:
-            for lon in selected_lons:
-                # Get data value for this point
-                value = float(annual_data.sel(calendar_year=year, lat=lat, lon=lon, method='nearest').values)
-                test_points.append({
-                    'calendar_year': int(year),
-                    'lat': float(lat),
-                    'lon': float(lon),
-                    variable_name.replace(' ', '_').lower(): value
-                })
-    
-    # Convert to DataFrame and save as CSV
-    test_df = pd.DataFrame(test_points)
+    selected_lats = rng.choice(lats, size=num_lat_points, replace=False)
+    selected_lons = rng.choice(lons, size=num_lon_points, replace=False)
+    
+    # Build the flattened Cartesian product of the selected years and coordinates
+    years_grid, lats_grid, lons_grid = np.meshgrid(selected_years, selected_lats, selected_lons, indexing='ij')
+    years_arr = years_grid.ravel().astype(np.int32)
+    lats_arr = lats_grid.ravel().astype(np.float64)
+    lons_arr = lons_grid.ravel().astype(np.float64)
+    
+    # Look up all test points with a single pointwise selection, cast once as a whole column
+    values = annual_data.sel(
+        calendar_year=xr.DataArray(years_arr, dims='pt'),
+        lat=xr.DataArray(lats_arr, dims='pt'),
+        lon=xr.DataArray(lons_arr, dims='pt'),
+        method='nearest'
+    ).values
+    values_arr = np.asarray(values).ravel().astype(np.float64)
+    
+    # Convert the columns to a DataFrame directly
+    return pd.DataFrame({
+        'calendar_year': years_arr,
+        'lat': lats_arr,
+        'lon': lons_arr,
+        test_point_column(variable_name): values_arr
+    })
+
+
+def generate_test_points_csv(annual_data, variable_name, output_path, bbox=None):
+    """
+    Generate approximately 10 test points from the climate dataset
+    and save them as a CSV file for testing purposes.
+    
+    Args:
+        annual_data: xarray DataArray with climate data
+        variable_name: Name of the climate variable
+        output_path: Base path for saving the CSV file
+        bbox (tuple): Optional bounding box (min_lon, max_lon, min_lat, max_lat) to restrict test points
+    """
+    test_df = sample_test_points(annual_data, variable_name, output_path, bbox)
+    if test_df is None:
+        return
     
     # Create CSV filename based on the NetCDF output path
-    csv_path = os.path.splitext(output_path)[0] + '_test_points.csv'
-    test_df.to_csv(csv_path, index=False)
-    print(f"Generated {len(test_points)} test points and saved to {csv_path}")
+    out = pathlib.Path(output_path)
+    csv_path = out.with_name(out.stem + '_test_points.csv')
+    write_test_points(test_df, csv_path)
+    print(f"Generated {len(test_df)} test points and saved to {csv_path}")
+
+
+def write_test_points(test_df, csv_path):
+    """
+    Save test points as a CSV for people and as a Parquet file alongside it for programs.
+    
+    Args:
+        test_df: DataFrame of test points
+        csv_path: Path of the CSV file; the Parquet file uses the same name with a .parquet suffix
+    """
+    # 9 significant digits keeps grid coordinates exact and round-trips float32 values
+    test_df.to_csv(csv_path, index=False, float_format='%.9g')
+    test_df.to_parquet(pathlib.Path(csv_path).with_suffix('.parquet'), index=False, compression='zstd')
 
 
 def parse_arguments():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Process climate data from Cal-Adapt.')
-    parser.add_argument('--county', type=str, required=True,
+    parser.add_argument('--from-file', type=str, metavar='PATH',
+                        help='Generate test points from a single previously exported output '
+                             'instead of downloading and processing')
+    parser.add_argument('--county', type=str,
                         help='County name to fetch data for (e.g., "Riverside County")')
-    parser.add_argument('--variable', type=str, required=True,
+    parser.add_argument('--variable', type=str,
                         help='Climate variable to process (e.g., "Precipitation (total)", "Temperature (min)")')
-    parser.add_argument('--aggregation', type=str, choices=['sum', 'min', 'max', 'mean'], required=True,
+    parser.add_argument('--aggregation', type=str, choices=['sum', 'min', 'max', 'mean'],
                         help='Method to aggregate data by year')
-    parser.add_argument('--simulation', type=str, required=True,
+    parser.add_argument('--simulation', type=str,
                         help='Name of the simulation to select')
-    parser.add_argument('--warming-level', type=float, required=True,
+    parser.add_argument('--warming-level', type=float,
                         help='Warming level to select (e.g., 2.0)')
     parser.add_argument('--output', type=str, required=True,
-                        help='Path where to save the output NetCDF file')
+                        help='Path where to save the output NetCDF file or Zarr store '
+                             '(with --from-file, the base path for the test points CSV)')
+    parser.add_argument('--format', type=str, choices=['NetCDF', 'Zarr'], default='NetCDF',
+                        help='Output format to write')
+    parser.add_argument('--force', action='store_true',
+                        help='Regenerate the output even if an up to date copy already exists')
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES,
+                        help='Refuse to download if the estimated working set exceeds this many bytes')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the estimated working set and exit without downloading')
     parser.add_argument('--generate-test-points', action='store_true',
                         help='Generate test points and save as CSV for validation')
     parser.add_argument('--bbox', type=float, nargs=4, metavar=('MIN_LON', 'MAX_LON', 'MIN_LAT', 'MAX_LAT'),
                         help='Bounding box to restrict test points (min_lon max_lon min_lat max_lat)')
-    return parser.parse_args()
+    args = parser.parse_args()
+    
+    # Downloading requires the full set of selection arguments
+    if not args.from_file:
+        missing = [
+            f"--{name.replace('_', '-')}"
+            for name in ['county', 'variable', 'aggregation', 'simulation', 'warming_level']
+            if getattr(args, name) is None
+        ]
+        if missing:
+            parser.error(f"the following arguments are required without --from-file: {', '.join(missing)}")
+    
+    return args
 
 # Main entry point
 if __name__ == "__main__":
     args = parse_arguments()
     
-    # Process data with command line arguments
-    processed_data = process_climate_data(
-        county=args.county,
-        variable_name=args.variable,
-        simulation_name=args.simulation,
-        warming_level=args.warming_level,
-        aggregation_method=args.aggregation,
-        output_path=args.output,
-        generate_test_points=args.generate_test_points,
-        bbox=args.bbox
-    )
+    # Estimate the download size before fetching anything, but only if something will be fetched
+    if args.from_file and args.dry_run:
+        print("--dry-run has no effect with --from-file, since nothing is downloaded. Exiting.")
+        raise SystemExit(0)
+    if not args.from_file:
+        key = output_key(args.county, args.variable, args.simulation, args.warming_level,
+                         args.aggregation, args.format)
+        current = not args.force and output_is_current(args.output, key)
+        if args.dry_run:
+            if current:
+                print(f"Output {args.output} is up to date, nothing would be downloaded.")
+            else:
+                estimate = estimate_working_set_bytes(args.county)
+                print(f"Estimated working set for {args.county}: {estimate / 1e9:.3f} GB")
+            raise SystemExit(0)
+        if not current:
+            try:
+                check_working_set(args.county, args.max_bytes)
+            except ValueError as error:
+                raise SystemExit(f"error: {error}")
     
-    print(f"Processing complete. Data saved to {args.output}")
\ No newline at end of file
+    with Client(n_workers=os.cpu_count(), threads_per_worker=1):
+        if args.from_file:
+            # Generate test points from an exported output without re-downloading; the output
+            # is opened lazily so the point selection only reads the chunks it touches
+            annual_data = open_output(args.from_file, args.format)
+            variable_name = args.variable or annual_data.attrs.get('variable', annual_data.name)
+            generate_test_points_csv(annual_data, variable_name, args.output, args.bbox)
+        else:
+            # Process data with command line arguments
+            processed_data = process_climate_data(
+                county=args.county,
+                variable_name=args.variable,
+                simulation_name=args.simulation,
+                warming_level=args.warming_level,
+                aggregation_method=args.aggregation,
+                output_path=args.output,
+                generate_test_points=args.generate_test_points,
+                bbox=args.bbox,
+                output_format=args.format,
+                force=args.force
+            )
+            print(f"Processing complete. Data saved to {args.output}")
\ No newline at end of file